@@ -16,65 +16,259 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library; if not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os
 import sys
+import ast
 import json
+import hashlib
+import getopt
+import tokenize
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_FILE = ".gettext-cache.json"
+
+# Tokens that may appear between the parts of an argument to _().
+SKIP_TOKENS = (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT,
+               tokenize.INDENT, tokenize.DEDENT)
+
+
+def scan_python(data):
+    # Collect the string literals passed to _(), including the ones that
+    # span multiple lines and the ones made of concatenated literals like
+    # _("foo "
+    #   "bar").
+    strings = set()
+    tokens = [t for t in tokenize.tokenize(io.BytesIO(data).readline)
+              if t.type not in SKIP_TOKENS]
+    i = 0
+    while i + 3 < len(tokens):
+        if (tokens[i].type != tokenize.NAME or tokens[i].string != '_' or
+                tokens[i + 1].string != '(' or
+                (0 < i and tokens[i - 1].string == '.')):
+            i += 1
+            continue
+        i += 2
+        literals = []
+        while tokens[i].type == tokenize.STRING:
+            literals.append(tokens[i].string)
+            i += 1
+        if not literals or tokens[i].string != ')':
+            continue
+        try:
+            string = ast.literal_eval(' '.join(literals))
+        except (SyntaxError, ValueError):
+            # e.g. f-strings cannot be translated.
+            continue
+        if isinstance(string, str):
+            strings.add(string)
+    return strings
+
+
+def scan_ui(data):
+    # Collect the texts of the elements marked as translatable="yes" in
+    # Gtk.Builder UI definitions.
+    strings = set()
+    for element in ElementTree.fromstring(data).iter():
+        if element.get('translatable') == 'yes' and element.text:
+            strings.add(element.text)
+    return strings
+
+
+def scan_file(filename):
+    # Returns the cache entry of filename, i.e., its mtime, SHA-1 digest and
+    # strings, all taken from the same contents. Returns None if filename
+    # cannot be read or parsed so that the other files can still be merged.
+    try:
+        # Take the mtime first so that a later modification is detected.
+        mtime = os.path.getmtime(filename)
+        with open(filename, 'rb') as file:
+            data = file.read()
+        if filename.endswith('.ui'):
+            strings = scan_ui(data)
+        else:
+            strings = scan_python(data)
+    except (OSError, UnicodeDecodeError, tokenize.TokenError, SyntaxError,
+            ElementTree.ParseError) as e:
+        print("Error: " + filename + ": " + str(e), file=sys.stderr)
+        return None
+    return {
+        'mtime': mtime,
+        'sha1': hashlib.sha1(data).hexdigest(),
+        'strings': sorted(strings),
+    }
+
+
+def file_digest(filename):
+    with open(filename, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def is_cache_entry(entry):
+    return (isinstance(entry, dict) and
+            isinstance(entry.get('mtime'), (int, float)) and
+            isinstance(entry.get('sha1'), str) and
+            isinstance(entry.get('strings'), list) and
+            all(isinstance(string, str) for string in entry['strings']))
+
 
 class GetText:
 
-    def __init__(self):
+    def __init__(self, cache_file=None):
         self.strings = set()
+        self.cache_file = cache_file
+        self.cache = {}
+        if cache_file:
+            try:
+                with open(cache_file, 'r') as file:
+                    self.cache = json.load(file)
+            except (OSError, ValueError):
+                self.cache = {}
+            # Discard a cache of the wrong shape.
+            if (not isinstance(self.cache, dict) or
+                    not all(is_cache_entry(e) for e in self.cache.values())):
+                self.cache = {}
+
+    def lookup(self, filename):
+        # Return the cached strings of filename if it has not been changed
+        # since the last scan; otherwise None.
+        entry = self.cache.get(filename)
+        if not entry:
+            return None
+        try:
+            mtime = os.path.getmtime(filename)
+            if entry['mtime'] == mtime:
+                return entry['strings']
+            if entry['sha1'] == file_digest(filename):
+                # touched, but not modified
+                entry['mtime'] = mtime
+                return entry['strings']
+        except OSError:
+            # Let scan_file() report the error.
+            del self.cache[filename]
+        return None
+
+    def scan(self, filenames, jobs=None):
+        pending = []
+        for filename in filenames:
+            strings = self.lookup(filename)
+            if strings is None:
+                pending.append(filename)
+            else:
+                self.strings.update(strings)
+        if not pending:
+            return
+        if len(pending) == 1:
+            results = [scan_file(pending[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(scan_file, pending))
+        for filename, entry in zip(pending, results):
+            if entry is None:
+                self.cache.pop(filename, None)
+                continue
+            self.strings.update(entry['strings'])
+            self.cache[filename] = entry
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        # Prune the entries of the files that no longer exist.
+        self.cache = {filename: entry for filename, entry in self.cache.items()
+                      if os.path.exists(filename)}
+        with open(self.cache_file, 'w') as file:
+            json.dump(self.cache, file, ensure_ascii=False, indent=1,
+                      sort_keys=True)
+            file.write("\n")
+
+    def merge(self, filename, prune=False):
+        # Merge the scanned strings into the catalog in filename, keeping
+        # the existing translations. The catalog is rewritten only if it
+        # has been changed. Returns True if the catalog has been updated.
+        try:
+            with open(filename, 'r') as file:
+                catalog = json.load(file)
+        except OSError:
+            catalog = {}
+        except ValueError as e:
+            # Do not overwrite a broken catalog to keep its translations.
+            sys.exit("Error: " + filename + ": " + str(e))
+        if not isinstance(catalog, dict):
+            sys.exit("Error: " + filename + ": not a JSON object")
+        merged = dict(catalog)
+        for string in self.strings:
+            merged.setdefault(string, string)
+        if prune:
+            merged = {k: v for k, v in merged.items() if k in self.strings}
+        if merged == catalog and os.path.exists(filename):
+            return False
+        self.emit(filename, merged)
+        return True
 
-    def scanline(self, line):
-        while line:
-            pos = line.find("_(")
-            if pos < 0:
-                return
-            line = line[pos+2:].strip()
-            if line[0] not in "'\"":
-                return
-            d = line[0]
-            line = line[1:]
-            s = d
-            escape = False
-            for c in line:
-                if escape:
-                    s += '\\' + c
-                    escape = False
-                elif c == '\\':
-                    escape = True
-                elif c == d:
-                    s += d
-                    d = ''
-                    break
-                else:
-                    s += c
-            if d:
-                return
-            line = line[len(s)-1:].strip()
-            if not line or line[0] != ')':
-                return
-            line = line[1:]
-            self.strings.add(s)
-
-    def scan(self, filename):
-        with open(filename, 'r') as file:
-            for line in file:
-                self.scanline(line)
-
-    def emit(self, filename):
-        with open(filename, 'w') as f:
-            f.write("{\n")
-            sep = ''
-            for string in sorted(self.strings):
-                f.write(sep + "    " + string + ": " + string)
-                sep = ",\n"
-            f.write("\n}\n")
+    def emit(self, filename, catalog=None):
+        if catalog is None:
+            catalog = {string: string for string in self.strings}
+        with open(filename, 'w') as file:
+            json.dump(catalog, file, ensure_ascii=False, indent=4,
+                      sort_keys=True)
+            file.write("\n")
 
+
+USAGE = """Usage: gettext.py [OPTION]... FILE...
+Extract the strings to be translated from Python and UI files, and merge
+them into JSON catalogs.
+
+  -o, --output=CATALOG  catalog to update; may be given more than once
+                        (default: the first FILE with .json suffix)
+  -j, --jobs=N          number of files to scan in parallel
+      --cache=FILE      cache file (default: %s)
+      --no-cache        scan every file regardless of the cache
+      --prune           remove the strings no longer used
+""" % CACHE_FILE
+
+# Note argparse cannot be used here since it imports the standard gettext
+# module, which is shadowed by this script.
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
+    try:
+        opts, files = getopt.gnu_getopt(
+            sys.argv[1:], 'o:j:h',
+            ['output=', 'jobs=', 'cache=', 'no-cache', 'prune', 'help'])
+    except getopt.GetoptError as e:
+        sys.exit("Error: " + str(e))
+
+    catalogs = []
+    jobs = None
+    cache_file = CACHE_FILE
+    prune = False
+    for opt, value in opts:
+        if opt in ('-o', '--output'):
+            catalogs.append(value)
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(value)
+            except ValueError:
+                jobs = 0
+            if jobs <= 0:
+                sys.exit("Error: invalid number of jobs: " + value)
+        elif opt == '--cache':
+            cache_file = value
+        elif opt == '--no-cache':
+            cache_file = None
+        elif opt == '--prune':
+            prune = True
+        elif opt in ('-h', '--help'):
+            print(USAGE, end='')
+            sys.exit(0)
+
+    if not files:
         sys.exit(0)
 
-    gettext = GetText()
-    gettext.scan(sys.argv[1])
-    gettext.emit(os.path.splitext(sys.argv[1])[0] + ".json")
+    gettext = GetText(cache_file)
+    gettext.scan(files, jobs)
+    gettext.save_cache()
+    if not catalogs:
+        catalogs = [os.path.splitext(files[0])[0] + ".json"]
+    for catalog in catalogs:
+        if gettext.merge(catalog, prune):
+            print("Updated " + catalog)
@@ -21,6 +21,7 @@ import sys
 import time
 import locale
 import json
+import tracemalloc
 
 import gi
 gi.require_version('Gtk', '3.0')
@@ -96,6 +97,7 @@ class EditorWindow(Gtk.ApplicationWindow):
         self.connect("key-press-event", self.on_key_press_event)
 
         self.buffer = self.textview.get_buffer()
+        self.buffer_bytes = len(content.encode())  # size of the text in UTF-8
         if content:
             self.buffer.set_text(content)
             self.buffer.set_modified(False)
@@ -125,6 +127,8 @@ class EditorWindow(Gtk.ApplicationWindow):
             "font": self.font_callback,
             "about": self.about_callback,
         }
+        if app.memory_log_interval is not None:
+            actions["memoryusage"] = self.memory_usage_callback
         for name, method in actions.items():
             action = Gio.SimpleAction.new(name, None)
             action.connect("activate", method)
@@ -222,6 +226,7 @@ class EditorWindow(Gtk.ApplicationWindow):
         return None
 
     def on_insert(self, textbuffer, iter, text, length):
+        self.buffer_bytes += len(text.encode())
         if self.user_action:
             self.undo.append(["insert_text", iter.get_offset(), text,
                               time.perf_counter()])
@@ -231,8 +236,9 @@ class EditorWindow(Gtk.ApplicationWindow):
         self.check_sentences(self.highlightlongsentences_action.get_state())
 
     def on_delete(self, textbuffer, start, end):
+        text = self.buffer.get_text(start, end, True)
+        self.buffer_bytes -= len(text.encode())
         if self.user_action:
-            text = self.buffer.get_text(start, end, True)
             self.undo.append(["delete_range", start.get_offset(), text,
                               time.perf_counter()])
             self.redo.clear()
@@ -542,6 +548,31 @@ class EditorWindow(Gtk.ApplicationWindow):
     def about_response_callback(self, dialog, response):
         dialog.destroy()
 
+    def memory_usage_callback(self, action, parameter):
+        print(self.get_application().get_memory_report())
+
+    def get_memory_usage(self):
+        # Returns a dict of the counts and the estimated sizes in bytes of
+        # the text buffer, the undo and redo entries, and the text tags.
+        usage = {
+            "chars": self.buffer.get_char_count(),
+            "buffer": self.buffer_bytes,
+            "undo": len(self.undo),
+            "undo_bytes": self.get_history_size(self.undo),
+            "redo": len(self.redo),
+            "redo_bytes": self.get_history_size(self.redo),
+            "tags": self.buffer.get_tag_table().get_size(),
+        }
+        return usage
+
+    def get_history_size(self, history):
+        size = sys.getsizeof(history)
+        for action in history:
+            size += sys.getsizeof(action)
+            for item in action:
+                size += sys.getsizeof(item)
+        return size
+
 
 class EditorApplication(Gtk.Application):
 
@@ -564,6 +595,27 @@ class EditorApplication(Gtk.Application):
         except OSError as e:
             self.uitexts = {}
 
+        # Set TEXTVIEW_EDITOR_MEMORY_LOG to the interval in seconds to log
+        # the memory usage periodically, or to 0 just to trace memory
+        # allocations. Either way the Memory Usage command is added to the
+        # Help menu.
+        self.memory_log_interval = None
+        interval = os.environ.get("TEXTVIEW_EDITOR_MEMORY_LOG")
+        if interval is not None:
+            try:
+                self.memory_log_interval = int(interval)
+            except ValueError:
+                pass
+            if self.memory_log_interval is None or self.memory_log_interval < 0:
+                self.memory_log_interval = None
+                print("Error: invalid TEXTVIEW_EDITOR_MEMORY_LOG: " + interval)
+        if self.memory_log_interval is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if 0 < self.memory_log_interval:
+                GLib.timeout_add_seconds(self.memory_log_interval,
+                                         self.on_memory_log_timeout)
+
     def do_activate(self):
         win = EditorWindow(self)
         win.show_all()
@@ -581,13 +633,64 @@ class EditorApplication(Gtk.Application):
             except GObject.GError as e:
                 print("Error: " + e.message)
                 sys.exit()
-        self.set_menubar(builder.get_object("menubar"))
+        menubar = builder.get_object("menubar")
+        if self.memory_log_interval is not None:
+            # The Memory Usage command is for developers only; add it to
+            # the Help menu only if TEXTVIEW_EDITOR_MEMORY_LOG is set.
+            section = Gio.Menu()
+            section.append("_Memory Usage", "win.memoryusage")
+            help_menu = menubar.get_item_link(menubar.get_n_items() - 1,
+                                              Gio.MENU_LINK_SUBMENU)
+            help_menu.append_section(None, section)
+        self.set_menubar(menubar)
 
     def do_open(self, files, *hint):
         for file in files:
             win = EditorWindow(self, file=file)
             win.show_all()
 
+    def on_memory_log_timeout(self):
+        print(time.strftime("%Y-%m-%d %H:%M:%S ") + self.get_memory_report())
+        return True
+
+    def get_memory_report(self, limit=10):
+        lines = ["Memory usage (estimated):"]
+        total = 0
+        for window in self.get_windows():
+            if not isinstance(window, EditorWindow):
+                continue
+            usage = window.get_memory_usage()
+            name = window.file.get_basename() if window.file else window.title
+            total += usage["buffer"] + usage["undo_bytes"] + usage["redo_bytes"]
+            lines.append(
+                "  %s: buffer %d chars (%d bytes), "
+                "undo %d entries (%d bytes), redo %d entries (%d bytes), "
+                "%d tags" % (name, usage["chars"], usage["buffer"],
+                             usage["undo"], usage["undo_bytes"],
+                             usage["redo"], usage["redo_bytes"],
+                             usage["tags"]))
+        lines.append("  Total of windows: %d bytes" % total)
+        size = sys.getsizeof(self.uitexts)
+        for key, value in self.uitexts.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+        lines.append("  uitexts: %d entries (%d bytes)" %
+                     (len(self.uitexts), size))
+        if not tracemalloc.is_tracing():
+            return "\n".join(lines)
+        # tracemalloc only sees the allocations made by Python for the whole
+        # process; the text buffers allocated by GTK are not included.
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append("  Process-wide Python allocations: %d bytes "
+                     "(peak %d bytes)" % (current, peak))
+        snapshot = tracemalloc.take_snapshot()
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        lines.append("  Largest process-wide Python allocations:")
+        for stat in snapshot.statistics("lineno")[:limit]:
+            lines.append("    " + str(stat))
+        return "\n".join(lines)
+
     def get_text(self, string):
         if string in self.uitexts:
             return self.uitexts[string]